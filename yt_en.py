@@ -1,17 +1,15 @@
-import yt_dlp
 import os
 import re
 import subprocess
-import json
 import sys
 import signal
 import atexit
-import traceback
 import datetime
-import gc
 import time
 import shutil
-from pathlib import Path
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 
 # === WAKE LOCK ===
@@ -52,28 +50,51 @@ signal.signal(signal.SIGINT, handle_exit)
 signal.signal(signal.SIGHUP, handle_exit)
 
 
+# === PATTERNS ===
+_SANITIZE_TABLE = str.maketrans(dict.fromkeys('\\/*?:"<>|', '_'))
+_PLAYLIST_RE = re.compile(r'playlist\?list=|/playlists/|&list=|/playlist/', re.IGNORECASE)
+# Alternatives are tried in order, like the separate patterns were:
+# prefixes at the start of the name first, then the first marker anywhere
+_CHAPTER_NUMBER_RE = re.compile(
+    r'(\d+)\s*[-–—]\s*'
+    r'|(\d+)\.\s*'
+    r'|\[(\d+)\]'
+    r'|.*?Part\s*(\d+)'
+    r'|.*?Chapter\s*(\d+)'
+    r'|.*?#(\d+)',
+    re.IGNORECASE | re.DOTALL,
+)
+# Whole description line, first timecode on it and its time part
+_CHAP_LINE_RE = re.compile(r"^(.*?(\(?(\d{1,2}[:]?\d{1,2}[:]\d{2})\)?).*)$", re.MULTILINE)
+# Chapter lists sit at the top of descriptions, bound the scan on huge ones
+_DESCRIPTION_SCAN_LIMIT = 16384
+
+
+# === YT-DLP ===
+# yt-dlp keeps player JS / signature data here between runs
+_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "yt-dlp")
+# Translated subtitle tracks are never used, skip building them
+_EXTRACTOR_ARGS = {'youtube': {'skip': ['translated_subs']}}
+
+
+# === MP3 ===
+# Bitrates in menu order
+_MP3_QUALITIES = (320, 256, 192, 128, 96, 64, 32, 16)
+
+
 def sanitize_filename(filename):
     """Remove invalid characters from filename."""
-    return re.sub(r'[\\/*?:"<>|]', "_", filename)
+    return filename.translate(_SANITIZE_TABLE)
 
 def extract_chapter_number(filename):
     """Extract chapter number from filename."""
-    patterns = [
-        r'^(\d+)\s*[-–—]\s*',
-        r'^(\d+)\.\s*',
-        r'^\[(\d+)\]',
-        r'Part\s*(\d+)',
-        r'Chapter\s*(\d+)',
-        r'#(\d+)',
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, filename, re.IGNORECASE)
-        if match:
-            return match.group(1).zfill(2) + " - "
+    match = _CHAPTER_NUMBER_RE.match(filename)
+    if match:
+        return match.group(match.lastindex).zfill(2) + " - "
     
     return ""
 
+@lru_cache(maxsize=1)
 def get_android_download_path():
     """Get download path for Android."""
     possible_paths = [
@@ -86,11 +107,9 @@ def get_android_download_path():
     ]
     
     for path in possible_paths:
-        try:
-            if os.path.exists(path) and os.access(path, os.W_OK):
-                return path
-        except Exception:
-            continue
+        # os.access is False for missing paths, no separate exists() check
+        if os.access(path, os.W_OK):
+            return path
     
     current_dir = os.getcwd()
     download_dir = os.path.join(current_dir, "Downloads")
@@ -138,7 +157,7 @@ def check_dependencies():
         return False
     
     try:
-        result = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True, env=os.environ.copy())
+        result = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
         if result.returncode == 0:
             print("✓ ffmpeg found")
         else:
@@ -149,22 +168,22 @@ def check_dependencies():
     return True
 
 def detect_url_type(url):
-    playlist_indicators = ['playlist?list=', '/playlists/', '&list=', '/playlist/']
-    for indicator in playlist_indicators:
-        if indicator in url.lower():
-            return 'playlist'
-    return 'video'
+    return 'playlist' if _PLAYLIST_RE.search(url) else 'video'
 
 def get_media_info(url, is_playlist_hint=False, quiet_mode=True):
     ydl_opts = {
         'quiet': quiet_mode, 
         'nocheckcertificate': True,
+        'cachedir': _CACHE_DIR,
+        'extractor_args': _EXTRACTOR_ARGS,
         'no_warnings': True,
         'ignoreerrors': True,
+        'noplaylist': not is_playlist_hint,
     }
     if is_playlist_hint:
         ydl_opts['extract_flat'] = 'in_playlist'
     
+    import yt_dlp
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(url, download=False)
@@ -188,24 +207,16 @@ def get_quality_format(formats, quality_choice):
 def parse_chapters_from_description(description):
     if not description: return []
     chapters = []
-    lines = description.split('\n')
     line_counter = 1
     
-    for line in lines:
-        result = re.search(r"\(?(\d{1,2}[:]?\d{1,2}[:]\d{2})\)?", line)
-        if not result: continue
-            
+    for result in _CHAP_LINE_RE.finditer(description):
+        line, timecode, time_str = result.groups()
         try:
-            time_str = result.group(1)
-            try:
-                time_count = datetime.datetime.strptime(time_str, '%H:%M:%S')
-            except ValueError:
-                time_count = datetime.datetime.strptime(time_str, '%M:%S')
+            chap_pos = parse_time_input(time_str)
+            if not chap_pos: continue
             
-            chap_name = line.replace(result.group(0), "").strip(' :\n-–—')
+            chap_name = line.replace(timecode, "").strip(' :\n-–—')
             if not chap_name: chap_name = f"Part {line_counter}"
-            
-            chap_pos = datetime.datetime.strftime(time_count, '%H:%M:%S')
             chapters.append((str(line_counter).zfill(2), chap_pos, chap_name))
             line_counter += 1
         except Exception: continue
@@ -213,17 +224,19 @@ def parse_chapters_from_description(description):
     return chapters
 
 def parse_time_input(time_str):
-    time_str = time_str.strip()
+    parts = time_str.strip().split(':')
     try:
-        if time_str.count(':') == 2:
-            time_obj = datetime.datetime.strptime(time_str, '%H:%M:%S')
-        elif time_str.count(':') == 1:
-            time_obj = datetime.datetime.strptime(time_str, '%M:%S')
+        if len(parts) == 3:
+            h, m, sec = map(int, parts)
+        elif len(parts) == 2:
+            h, m, sec = 0, int(parts[0]), int(parts[1])
+        elif len(parts) == 1:
+            h, m, sec = 0, 0, int(parts[0])
         else:
-            seconds = int(time_str)
-            time_obj = datetime.datetime.strptime(f'00:{seconds}', '%M:%S')
-        return datetime.datetime.strftime(time_obj, '%H:%M:%S')
-    except Exception: return None
+            return None
+    except ValueError: return None
+    if h < 0 or not (0 <= m < 60 and 0 <= sec < 60): return None
+    return f"{h:02d}:{m:02d}:{sec:02d}"
 
 def manual_timecode_input():
     print("\n=== Manual timecode input ===")
@@ -261,8 +274,19 @@ def manual_timecode_input():
         except KeyboardInterrupt: return []
         except Exception as e: print(f"Error: {e}")
 
+def parse_playlist_range(input_str):
+    """Parse 'A-B' or 'N' into 1-based (start, end) playlist indexes."""
+    try:
+        if '-' in input_str:
+            start, end = (int(p) for p in input_str.split('-'))
+        else:
+            start = end = int(input_str)
+    except ValueError: return None
+    if 1 <= start <= end: return start, end
+    return None
+
 def parse_chapter_selection(input_str, total_chapters):
-    selected = set()
+    selected = bytearray(total_chapters + 1)
     try:
         parts = input_str.split(',')
         for part in parts:
@@ -271,89 +295,80 @@ def parse_chapter_selection(input_str, total_chapters):
                 start, end = part.split('-')
                 start, end = int(start.strip()), int(end.strip())
                 if 1 <= start <= total_chapters and 1 <= end <= total_chapters and start <= end:
-                    selected.update(range(start, end + 1))
+                    selected[start:end + 1] = b'\x01' * (end - start + 1)
             else:
                 num = int(part)
-                if 1 <= num <= total_chapters: selected.add(num)
-        return sorted(list(selected))
+                if 1 <= num <= total_chapters: selected[num] = 1
+        return [i for i, flag in enumerate(selected) if flag]
     except Exception: return []
 
-def get_video_duration(video_path):
-    try:
-        result = subprocess.run(
-            ['ffprobe', '-i', video_path, '-show_entries', 'format=duration', '-v', 'quiet'],
-            capture_output=True, text=True, encoding='utf-8', env=os.environ.copy()
-        )
-        duration_match = re.search(r'duration=(\d+\.?\d*)', result.stdout)
-        if duration_match:
-            duration_seconds = float(duration_match.group(1))
-            m, s = divmod(duration_seconds, 60)
-            h, m = divmod(m, 60)
-            return ':'.join([str(int(h)), str(int(m)), str(s)])
-        return None
-    except Exception as e:
-        print(f"Error getting duration: {e}")
-        return None
-
 def split_video_by_segments(video_path, segments, output_dir):
     if not segments: return False
     video_name = os.path.splitext(os.path.basename(video_path))[0]
-    current_duration = get_video_duration(video_path)
-    
-    if not current_duration:
-        print("Could not determine video duration.")
-        return False
     
     os.makedirs(output_dir, exist_ok=True)
     print(f"\nSplitting video into {len(segments)} parts...")
-    successful = 0
     
+    # Parallel workers must not share an output file, number repeated titles
+    output_names = []
+    seen = set()
     for idx, segment in enumerate(segments, 1):
+        segment_name = sanitize_filename(segment.get('name', f'Part {idx:02d}'))
+        unique_name, n = segment_name, idx
+        while unique_name.lower() in seen:
+            unique_name = f'{segment_name} ({n})'
+            n += 1
+        seen.add(unique_name.lower())
+        output_names.append(f'{video_name} - {unique_name}.mp4')
+    
+    def _cut(idx, segment, output_name):
         try:
             start_time = segment['start']
-            end_time = segment.get('end', current_duration)
-            name = segment.get('name', f'Part {idx:02d}')
-            
-            segment_name = sanitize_filename(name)
-            output_name = f'{video_name} - {segment_name}.mp4'
+            end_time = segment.get('end')
             output_path = os.path.join(output_dir, output_name)
             
-            print(f"Processing {idx}/{len(segments)}: {start_time} - {end_time}")
+            print(f"Processing {idx}/{len(segments)}: {start_time} - {end_time or 'end of video'}")
             
-            cmd = [
-                "ffmpeg", "-y", "-ss", start_time, "-to", end_time,
+            cmd = ["ffmpeg", "-y", "-ss", start_time]
+            # Last segment runs to the end of the file
+            if end_time:
+                cmd.extend(["-to", end_time])
+            cmd.extend([
                 "-i", video_path,
                 "-c", "copy",
-                "-avoid_negative_ts", "1",
+                "-avoid_negative_ts", "make_zero",
                 output_path
-            ]
+            ])
             
-            result = subprocess.run(cmd, capture_output=True, text=True, env=os.environ.copy())
+            result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             
             if result.returncode == 0:
-                successful += 1
                 print(f"✓ Created: {output_name}")
-            else:
-                print(f"✗ ffmpeg error: {output_name}")
+                return True
+            print(f"✗ ffmpeg error: {output_name}")
         except Exception as e:
             print(f"✗ Segment {idx} error: {e}")
+        return False
+    
+    # Stream-copy cuts are I/O bound, run a few ffmpeg processes at once
+    with ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 2)) as executor:
+        successful = sum(executor.map(_cut, range(1, len(segments) + 1), segments, output_names))
     
     print(f"\nSplitting complete: {successful}/{len(segments)} successful")
     return successful > 0
 
 def select_mp3_quality(auto_best=False):
-    qualities = [320, 256, 192, 128, 96, 64, 32, 16]
     if auto_best:
-        return str(qualities[0])
+        return str(_MP3_QUALITIES[0])
 
     print("\nSelect MP3 quality:")
-    for i, q_val in enumerate(qualities):
+    for i, q_val in enumerate(_MP3_QUALITIES):
         print(f"  {i}) {q_val} kbps")
     
     while True:
         try:
             choice = int(input("Your choice: "))
-            if 0 <= choice < len(qualities): return str(qualities[choice])
+            if 0 <= choice < len(_MP3_QUALITIES): return str(_MP3_QUALITIES[choice])
         except ValueError: pass
 
 def main():
@@ -392,37 +407,19 @@ def main():
         download_title = "YT_Download"
         is_playlist_download = False
         total_items = 1
+        all_formats = []
+        quick_range = None
+        start_index = 0
+        end_index = None
 
         if url_type == 'playlist':
             is_playlist_download = True
-            print("Analyzing playlist...")
-            playlist_info = get_media_info(url, is_playlist_hint=True, quiet_mode=False)
-            if not playlist_info or 'entries' not in playlist_info: 
-                release_wake_lock()
-                return
-            
-            entries = [e for e in playlist_info['entries'] if e is not None]
-            if not entries: 
-                release_wake_lock()
-                return
-            
-            download_title = sanitize_filename(playlist_info.get('title', 'YT_Playlist'))
-            total_items = len(entries)
-            print(f"Playlist: {download_title} ({total_items} videos)")
-            
-            video_info_for_formats = None
-            all_formats = []
+            r_input = input("Range first (Enter = scan whole playlist, example 1-5): ").strip()
+            if r_input:
+                quick_range = parse_playlist_range(r_input)
+                if not quick_range:
+                    print("Range not recognized (use A-B or N), scanning the whole playlist")
 
-        else:
-            print("Analyzing video...")
-            video_info_for_formats = get_media_info(url, quiet_mode=False)
-            if not video_info_for_formats: 
-                release_wake_lock()
-                return
-            download_title = sanitize_filename(video_info_for_formats.get('title', 'YT_Video'))
-            print(f"Video: {download_title}")
-            all_formats = video_info_for_formats.get('formats', [])
-        
         print("\nQuality:")
         quality_choice = get_numeric_choice(
             "", ["Auto", "≤ 1080p", "≤ 720p", "≤ 360p", "Audio only"], True, 0
@@ -461,9 +458,26 @@ def main():
                 elif action_choice == 2:
                     split_mode = 'chapters'
 
-        start_index = 0
-        end_index = None
-        if is_playlist_download:
+        if is_playlist_download and quick_range:
+            # Range is known: hand it straight to the download, no playlist scan
+            start_index, end_index = quick_range[0] - 1, quick_range[1]
+            total_items = end_index
+        elif is_playlist_download:
+            print("Analyzing playlist...")
+            playlist_info = get_media_info(url, is_playlist_hint=True, quiet_mode=False)
+            if not playlist_info or 'entries' not in playlist_info: 
+                release_wake_lock()
+                return
+            
+            total_items = sum(1 for e in playlist_info['entries'] if e is not None)
+            if not total_items: 
+                release_wake_lock()
+                return
+            
+            download_title = sanitize_filename(playlist_info.get('title', 'YT_Playlist'))
+            print(f"Playlist: {download_title} ({total_items} videos)")
+
+        if is_playlist_download and not quick_range:
             r_input = input(f"Range (Enter=all, example 1-5): ").strip()
             if r_input:
                 sel = parse_chapter_selection(r_input, total_items)
@@ -471,18 +485,44 @@ def main():
                     start_index = sel[0] - 1
                     end_index = sel[-1]
 
+        # Videos with Auto quality and no processing, and playlists with a
+        # range given up front, need no metadata: one extract+download pass
+        single_pass = bool(quick_range) or (
+            not is_playlist_download and quality_choice == 0 and not split_mode
+        )
+        if not is_playlist_download and not single_pass:
+            print("Analyzing video...")
+            video_info_for_formats = get_media_info(url, quiet_mode=False)
+            if not video_info_for_formats: 
+                release_wake_lock()
+                return
+            download_title = sanitize_filename(video_info_for_formats.get('title', 'YT_Video'))
+            print(f"Video: {download_title}")
+
         save_dir_base = get_android_download_path()
-        save_dir = os.path.join(save_dir_base, download_title)
-        temp_dir = os.path.join(save_dir, 'temp')
-        
-        try: 
-            os.makedirs(save_dir, exist_ok=True)
-            os.makedirs(temp_dir, exist_ok=True)
-        except: 
-            save_dir = save_dir_base
-            temp_dir = save_dir
-        
-        print(f"\nSaving to: {save_dir}")
+        if single_pass:
+            # Title is unknown until download, save folder is created afterwards
+            save_dir = None
+            # Fixed per-URL folder, so a rerun resumes the partial files
+            temp_dir = os.path.join(save_dir_base, '.yt_temp_' + hashlib.sha1(url.encode()).hexdigest()[:12])
+            try:
+                os.makedirs(temp_dir, exist_ok=True)
+            except OSError:
+                save_dir = save_dir_base
+                temp_dir = save_dir
+        else:
+            save_dir = os.path.join(save_dir_base, download_title)
+            temp_dir = os.path.join(save_dir, 'temp')
+            
+            try: 
+                # temp lives inside save_dir, one makedirs creates both
+                if not os.path.isdir(temp_dir):
+                    os.makedirs(temp_dir, exist_ok=True)
+            except: 
+                save_dir = save_dir_base
+                temp_dir = save_dir
+            
+            print(f"\nSaving to: {save_dir}")
 
         output_tmpl = '%(title)s'
         if is_playlist_download:
@@ -499,6 +539,8 @@ def main():
             'postprocessors': postprocessors_opts,
             'quiet': False,
             'nocheckcertificate': True,
+            'cachedir': _CACHE_DIR,
+            'extractor_args': _EXTRACTOR_ARGS,
             'ignoreerrors': True,
         }
 
@@ -515,33 +557,68 @@ def main():
         downloaded_mp3_files = []
         downloaded_video_file = None
 
+        convert_to_mp3 = any(p.get('preferredcodec') == 'mp3' for p in postprocessors_opts)
+        last_progress_time = 0.0
+        last_progress_str = None
+
         def download_hook(d):
+            nonlocal downloaded_video_file, last_progress_time, last_progress_str
             if d['status'] == 'finished':
+                # MP3 path is reported by post_hook after conversion
+                if convert_to_mp3: return
                 filepath = d.get('filepath') or d.get('filename')
                 if not filepath: return
-                
-                time.sleep(0.5) 
-
-                if postprocessors_opts and any(p.get('preferredcodec') == 'mp3' for p in postprocessors_opts):
-                    base, _ = os.path.splitext(filepath)
-                    mp3_filepath = base + ".mp3"
-                    downloaded_mp3_files.append(mp3_filepath)
-                    print(f"\nDone: {os.path.basename(mp3_filepath)}")
-                else:
-                    nonlocal downloaded_video_file
-                    downloaded_video_file = filepath
-                    print(f"\nDone: {os.path.basename(filepath)}")
+                downloaded_video_file = filepath
+                print(f"\nDone: {os.path.basename(filepath)}")
             
             elif d['status'] == 'downloading':
                 p = d.get('_percent_str', 'N/A')
-                if p != 'N/A': print(f"\rDownloading: {p}", end='', flush=True)
+                if p == 'N/A' or p == last_progress_str: return
+                # Redraw progress at most every 200 ms, 100% always
+                now = time.monotonic()
+                if now - last_progress_time < 0.2 and '100' not in p: return
+                last_progress_time = now
+                last_progress_str = p
+                print(f"\rDownloading: {p}", end='', flush=True)
+
+        # Called by yt-dlp with the final path, after all postprocessors
+        def post_hook(filepath):
+            if not convert_to_mp3 or not filepath: return
+            downloaded_mp3_files.append(filepath)
+            print(f"\nDone: {os.path.basename(filepath)}")
 
         ydl_opts['progress_hooks'] = [download_hook]
+        ydl_opts['post_hooks'] = [post_hook]
 
         print("\nStarting download...")
         
+        import yt_dlp
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+            if single_pass:
+                downloaded_info = ydl.extract_info(url, download=True)
+                if not is_playlist_download:
+                    video_info_for_formats = downloaded_info
+            else:
+                # Reuse metadata from the analysis step instead of extracting it again
+                # A direct call skips the error handling extract_info has
+                try:
+                    ydl.process_ie_result(playlist_info if is_playlist_download else video_info_for_formats, download=True)
+                except (yt_dlp.utils.ExtractorError, yt_dlp.utils.DownloadError) as e:
+                    ydl.report_error(str(e))
+        
+        if save_dir is None:
+            if downloaded_info:
+                default_title = 'YT_Playlist' if is_playlist_download else 'YT_Video'
+                download_title = sanitize_filename(downloaded_info.get('title', default_title))
+                save_dir = os.path.join(save_dir_base, download_title)
+                try:
+                    if not os.path.isdir(save_dir):
+                        os.makedirs(save_dir, exist_ok=True)
+                except OSError:
+                    save_dir = save_dir_base
+            else:
+                save_dir = save_dir_base
+            print(f"\nSaving to: {save_dir}")
         
         # Find final file in temp (after merge)
         if not is_audio_only and not postprocessors_opts:
@@ -563,21 +640,18 @@ def main():
                 start_time = cut_segment['start']
                 end_time = cut_segment.get('end')
                 
-                if not end_time:
-                    end_time = get_video_duration(downloaded_video_file)
-                
                 video_name = os.path.splitext(os.path.basename(downloaded_video_file))[0]
                 output_name = f'{video_name}_cut.mp4'
                 output_path = os.path.join(save_dir, output_name)  # To root folder
                 
-                print(f"Cutting: {start_time} - {end_time}")
+                print(f"Cutting: {start_time} - {end_time or 'end of video'}")
                 
-                cmd = ['ffmpeg', '-y', '-ss', start_time]
+                cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-ss', start_time]
                 if end_time:
                     cmd.extend(['-to', end_time])
-                cmd.extend(['-i', downloaded_video_file, '-c', 'copy', '-avoid_negative_ts', '1', output_path])
+                cmd.extend(['-i', downloaded_video_file, '-c', 'copy', '-avoid_negative_ts', 'make_zero', output_path])
                 
-                result = subprocess.run(cmd, capture_output=True, text=True, env=os.environ.copy())
+                result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
                 
                 if result.returncode == 0:
                     print(f"✓ Created: {output_name}")
@@ -611,7 +685,12 @@ def main():
                             t_str = str(datetime.timedelta(seconds=int(c['start_time'])))
                             segments.append({'start': t_str, 'end': None, 'name': c['title']})
                     else:
-                        segments = parse_chapters_from_description(video_info_for_formats.get('description', ''))
+                        description = (video_info_for_formats.get('description') or '')[:_DESCRIPTION_SCAN_LIMIT]
+                        if description:
+                            segments = [
+                                {'start': start, 'end': None, 'name': name}
+                                for _, start, name in parse_chapters_from_description(description)
+                            ]
                 
                 if not segments:
                     print("Chapters not found.")
@@ -625,11 +704,8 @@ def main():
                             inds = parse_chapter_selection(sel_in, len(segments))
                             if inds: segments = [segments[i-1] for i in inds]
                     
-                    dur_str = get_video_duration(downloaded_video_file)
-                    for i, s in enumerate(segments):
-                        if not s['end']:
-                            if i + 1 < len(segments): s['end'] = segments[i+1]['start']
-                            else: s['end'] = dur_str
+                    for i, s in enumerate(segments[:-1]):
+                        if not s['end']: s['end'] = segments[i+1]['start']
                     
                     # Save chapters to root folder
                     split_video_by_segments(downloaded_video_file, segments, save_dir)
@@ -665,6 +741,7 @@ def main():
         release_wake_lock()
     except Exception as e:
         print(f"\nCritical error: {e}")
+        import traceback
         traceback.print_exc()
         release_wake_lock()
 
@@ -1,17 +1,16 @@
-import yt_dlp
 import os
 import re
 import subprocess
-import json
 import sys
 import signal
 import atexit
-import traceback
 import datetime
-import gc
 import time
 import shutil
-from pathlib import Path
+import hashlib
+import bisect
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 
 # === WAKE LOCK ===
@@ -52,12 +51,52 @@ signal.signal(signal.SIGINT, handle_exit)
 signal.signal(signal.SIGHUP, handle_exit)
 
 
+# === PATTERNS ===
+_SANITIZE_TABLE = str.maketrans(dict.fromkeys('\\/*?:"<>|', '_'))
+_PLAYLIST_RE = re.compile(r'playlist\?list=|/playlists/|&list=|/playlist/', re.IGNORECASE)
+# Варианты перебираются по порядку, как отдельные шаблоны раньше:
+# сначала префиксы в начале имени, затем первое вхождение маркера
+_CHAPTER_NUMBER_RE = re.compile(
+    r'(\d+)\s*[-–—]\s*'     # "01 - название"
+    r'|(\d+)\.\s*'          # "01. название"
+    r'|\[(\d+)\]'           # "[01] название"
+    r'|.*?Часть\s*(\d+)'    # "Часть 01"
+    r'|.*?Part\s*(\d+)'     # "Part 01"
+    r'|.*?#(\d+)',          # "#01"
+    re.IGNORECASE | re.DOTALL,
+)
+# Строка описания целиком, первый таймкод в ней и его время
+_CHAP_LINE_RE = re.compile(r"^(.*?(\(?(\d{1,2}[:]?\d{1,2}[:]\d{2})\)?).*)$", re.MULTILINE)
+# Список глав стоит в начале описания, ограничиваем сканирование огромных
+_DESCRIPTION_SCAN_LIMIT = 16384
+
+
+# === YT-DLP ===
+# yt-dlp хранит здесь данные плеера и подписей между запусками
+_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "yt-dlp")
+# Переведённые субтитры не используются, не строим их
+_EXTRACTOR_ARGS = {'youtube': {'skip': ['translated_subs']}}
+
+
+# === PATHS ===
+# abspath() вызывает getcwd, поэтому считаем пути один раз при импорте
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+_MODEL_CONFIG_PATH = os.path.join(_SCRIPT_DIR, "model_config.json")
+_TRANSCRIBE_SCRIPT = os.path.join(_SCRIPT_DIR, "transcribe.py")
+
+
+# === MP3 ===
+# Битрейты в порядке меню, по возрастанию — для bisect в авто-выборе
+_MP3_QUALITIES = (320, 256, 192, 128, 96, 64, 32, 16)
+_QS_ASC = tuple(sorted(_MP3_QUALITIES))
+
+
 # === COOKIES ===
+@lru_cache(maxsize=1)
 def get_cookies_path():
     """Ищет файл cookies.txt рядом со скриптом или в стандартных местах"""
-    script_dir = os.path.dirname(os.path.abspath(__file__))
     possible_paths = [
-        os.path.join(script_dir, 'cookies.txt'),
+        os.path.join(_SCRIPT_DIR, 'cookies.txt'),
         '/storage/emulated/0/cookies.txt',
         '/storage/emulated/0/Download/cookies.txt',
         '/storage/emulated/0/Downloads/cookies.txt',
@@ -71,45 +110,27 @@ def get_cookies_path():
 
 def sanitize_filename(filename):
     """Очищает имя файла от недопустимых символов."""
-    return re.sub(r'[\\/*?:"<>|]', "_", filename)
+    return filename.translate(_SANITIZE_TABLE)
 
 def extract_chapter_number(filename):
     """Извлекает номер главы из названия файла."""
-    patterns = [
-        r'^(\d+)\s*[-–—]\s*',  # "01 - название"
-        r'^(\d+)\.\s*',         # "01. название"
-        r'^\[(\d+)\]',          # "[01] название"
-        r'Часть\s*(\d+)',       # "Часть 01"
-        r'Part\s*(\d+)',        # "Part 01"
-        r'#(\d+)',              # "#01"
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, filename, re.IGNORECASE)
-        if match:
-            return match.group(1).zfill(2) + " - "
+    match = _CHAPTER_NUMBER_RE.match(filename)
+    if match:
+        return match.group(match.lastindex).zfill(2) + " - "
     
     return ""
 
 def clean_filename_from_playlist(filename):
     """Очищает имя файла от префикса плейлиста."""
-    name, ext = os.path.splitext(filename)
-    chapter_prefix = extract_chapter_number(name)
-    
-    if " - " in name:
-        parts = name.split(" - ", 1)
-        if len(parts) > 1:
-            if parts[0].strip().isdigit() or re.match(r'^\d+$', parts[0].strip()):
-                clean_name = chapter_prefix + parts[1].strip()
-            else:
-                clean_name = chapter_prefix + parts[1].strip()
-        else:
-            clean_name = name
-    else:
-        clean_name = name
+    # Имена приходят от yt-dlp и всегда с расширением
+    head, dot, ext = filename.rpartition('.')
+    name, ext = (head, dot + ext) if dot else (filename, '')
+    _, sep, rest = name.partition(" - ")
+    clean_name = extract_chapter_number(name) + rest.strip() if sep else name
     
     return clean_name + ext
 
+@lru_cache(maxsize=1)
 def get_android_download_path():
     """Определяет путь для скачивания на Android с проверкой доступности."""
     possible_paths = [
@@ -122,11 +143,9 @@ def get_android_download_path():
     ]
     
     for path in possible_paths:
-        try:
-            if os.path.exists(path) and os.access(path, os.W_OK):
-                return path
-        except Exception as e:
-            continue
+        # os.access возвращает False для несуществующих путей, exists() не нужен
+        if os.access(path, os.W_OK):
+            return path
     
     current_dir = os.getcwd()
     download_dir = os.path.join(current_dir, "Downloads")
@@ -165,13 +184,11 @@ def get_numeric_choice(prompt, options, allow_enter_for_default=False, default_i
 def load_model_config():
     """Загружает конфигурацию моделей."""
     try:
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        config_path = os.path.join(script_dir, "model_config.json")
-        
-        if not os.path.exists(config_path):
+        import json
+        if not os.path.exists(_MODEL_CONFIG_PATH):
             return get_default_config()
             
-        with open(config_path, encoding="utf-8") as f:
+        with open(_MODEL_CONFIG_PATH, encoding="utf-8") as f:
             return json.load(f)
     except Exception as e:
         return get_default_config()
@@ -197,8 +214,7 @@ def check_dependencies():
         return False
     
     try:
-        # env=os.environ.copy() критически важен для Termux
-        result = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True, env=os.environ.copy())
+        result = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
         if result.returncode == 0:
             print("✓ ffmpeg найден")
         else:
@@ -216,17 +232,15 @@ def check_dependencies():
     return True
 
 def detect_url_type(url):
-    playlist_indicators = ['playlist?list=', '/playlists/', '&list=', '/playlist/']
-    for indicator in playlist_indicators:
-        if indicator in url.lower():
-            return 'playlist'
-    return 'video'
+    return 'playlist' if _PLAYLIST_RE.search(url) else 'video'
 
 def get_base_ydl_opts(cookies_path=None):
     """Базовые опции yt-dlp с cookies и стабильностью"""
     opts = {
         'quiet': True,
         'nocheckcertificate': True,
+        'cachedir': _CACHE_DIR,
+        'extractor_args': _EXTRACTOR_ARGS,
         'no_warnings': True,
         'socket_timeout': 30,
         'retries': 10,
@@ -243,14 +257,18 @@ def get_media_info(url, is_playlist_hint=False, quiet_mode=True, cookies_path=No
     ydl_opts = {
         'quiet': quiet_mode, 
         'nocheckcertificate': True,
+        'cachedir': _CACHE_DIR,
+        'extractor_args': _EXTRACTOR_ARGS,
         'no_warnings': True,
         'ignoreerrors': True,
+        'noplaylist': not is_playlist_hint,
     }
     if is_playlist_hint:
         ydl_opts['extract_flat'] = 'in_playlist'
     if cookies_path:
         ydl_opts['cookiefile'] = cookies_path
     
+    import yt_dlp
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(url, download=False)
@@ -263,11 +281,14 @@ def get_video_specific_info(video_url, quiet_mode=True, cookies_path=None):
     ydl_opts = {
         'quiet': quiet_mode, 
         'nocheckcertificate': True, 
+        'cachedir': _CACHE_DIR,
+        'extractor_args': _EXTRACTOR_ARGS,
         'no_warnings': True,
         'ignoreerrors': True,
     }
     if cookies_path:
         ydl_opts['cookiefile'] = cookies_path
+    import yt_dlp
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(video_url, download=False)
@@ -291,24 +312,16 @@ def get_quality_format(formats, quality_choice):
 def parse_chapters_from_description(description):
     if not description: return []
     chapters = []
-    lines = description.split('\n')
     line_counter = 1
     
-    for line in lines:
-        result = re.search(r"\(?(\d{1,2}[:]?\d{1,2}[:]\d{2})\)?", line)
-        if not result: continue
-            
+    for result in _CHAP_LINE_RE.finditer(description):
+        line, timecode, time_str = result.groups()
         try:
-            time_str = result.group(1)
-            try:
-                time_count = datetime.datetime.strptime(time_str, '%H:%M:%S')
-            except ValueError:
-                time_count = datetime.datetime.strptime(time_str, '%M:%S')
+            chap_pos = parse_time_input(time_str)
+            if not chap_pos: continue
             
-            chap_name = line.replace(result.group(0), "").strip(' :\n-–—')
+            chap_name = line.replace(timecode, "").strip(' :\n-–—')
             if not chap_name: chap_name = f"Часть {line_counter}"
-            
-            chap_pos = datetime.datetime.strftime(time_count, '%H:%M:%S')
             chapters.append((str(line_counter).zfill(2), chap_pos, chap_name))
             line_counter += 1
         except Exception: continue
@@ -316,17 +329,19 @@ def parse_chapters_from_description(description):
     return chapters
 
 def parse_time_input(time_str):
-    time_str = time_str.strip()
+    parts = time_str.strip().split(':')
     try:
-        if time_str.count(':') == 2:
-            time_obj = datetime.datetime.strptime(time_str, '%H:%M:%S')
-        elif time_str.count(':') == 1:
-            time_obj = datetime.datetime.strptime(time_str, '%M:%S')
+        if len(parts) == 3:
+            h, m, sec = map(int, parts)
+        elif len(parts) == 2:
+            h, m, sec = 0, int(parts[0]), int(parts[1])
+        elif len(parts) == 1:
+            h, m, sec = 0, 0, int(parts[0])
         else:
-            seconds = int(time_str)
-            time_obj = datetime.datetime.strptime(f'00:{seconds}', '%M:%S')
-        return datetime.datetime.strftime(time_obj, '%H:%M:%S')
-    except Exception: return None
+            return None
+    except ValueError: return None
+    if h < 0 or not (0 <= m < 60 and 0 <= sec < 60): return None
+    return f"{h:02d}:{m:02d}:{sec:02d}"
 
 def manual_timecode_input():
     print("\n=== Ручной ввод таймкодов ===")
@@ -364,8 +379,19 @@ def manual_timecode_input():
         except KeyboardInterrupt: return []
         except Exception as e: print(f"Ошибка: {e}")
 
+def parse_playlist_range(input_str):
+    """Разбирает 'A-B' или 'N' в пару индексов плейлиста (start, end), с 1."""
+    try:
+        if '-' in input_str:
+            start, end = (int(p) for p in input_str.split('-'))
+        else:
+            start = end = int(input_str)
+    except ValueError: return None
+    if 1 <= start <= end: return start, end
+    return None
+
 def parse_chapter_selection(input_str, total_chapters):
-    selected = set()
+    selected = bytearray(total_chapters + 1)
     try:
         parts = input_str.split(',')
         for part in parts:
@@ -374,101 +400,91 @@ def parse_chapter_selection(input_str, total_chapters):
                 start, end = part.split('-')
                 start, end = int(start.strip()), int(end.strip())
                 if 1 <= start <= total_chapters and 1 <= end <= total_chapters and start <= end:
-                    selected.update(range(start, end + 1))
+                    selected[start:end + 1] = b'\x01' * (end - start + 1)
             else:
                 num = int(part)
-                if 1 <= num <= total_chapters: selected.add(num)
-        return sorted(list(selected))
+                if 1 <= num <= total_chapters: selected[num] = 1
+        return [i for i, flag in enumerate(selected) if flag]
     except Exception: return []
 
-def get_video_duration(video_path):
-    try:
-        # Важно: env=os.environ.copy() для Termux
-        result = subprocess.run(
-            ['ffprobe', '-i', video_path, '-show_entries', 'format=duration', '-v', 'quiet'],
-            capture_output=True, text=True, encoding='utf-8', env=os.environ.copy()
-        )
-        duration_match = re.search(r'duration=(\d+\.?\d*)', result.stdout)
-        if duration_match:
-            duration_seconds = float(duration_match.group(1))
-            m, s = divmod(duration_seconds, 60)
-            h, m = divmod(m, 60)
-            return ':'.join([str(int(h)), str(int(m)), str(s)])
-        return None
-    except Exception as e:
-        print(f"Ошибка получения длительности: {e}")
-        return None
-
 def split_video_by_segments(video_path, segments, output_dir):
     if not segments: return False
     video_name = os.path.splitext(os.path.basename(video_path))[0]
-    current_duration = get_video_duration(video_path)
-    
-    if not current_duration:
-        print("Не определена длительность видео.")
-        return False
     
     print(f"\nРазделение видео на {len(segments)} частей...")
-    successful = 0
     
+    # Параллельные потоки не должны писать в один файл, нумеруем повторы названий
+    output_names = []
+    seen = set()
     for idx, segment in enumerate(segments, 1):
+        segment_name = sanitize_filename(segment.get('name', f'Часть {idx:02d}'))
+        unique_name, n = segment_name, idx
+        while unique_name.lower() in seen:
+            unique_name = f'{segment_name} ({n})'
+            n += 1
+        seen.add(unique_name.lower())
+        output_names.append(f'{video_name} - {unique_name}.mp4')
+    
+    def _cut(idx, segment, output_name):
         try:
             start_time = segment['start']
-            end_time = segment.get('end', current_duration)
-            name = segment.get('name', f'Часть {idx:02d}')
-            
-            segment_name = sanitize_filename(name)
-            output_name = f'{video_name} - {segment_name}.mp4'
+            end_time = segment.get('end')
             output_path = os.path.join(output_dir, output_name)
             
-            print(f"Обработка {idx}/{len(segments)}: {start_time} - {end_time}")
+            print(f"Обработка {idx}/{len(segments)}: {start_time} - {end_time or 'до конца'}")
             
-            cmd = [
-                "ffmpeg", "-ss", start_time, "-to", end_time,
+            cmd = ["ffmpeg", "-ss", start_time]
+            # Последний сегмент идёт до конца файла
+            if end_time:
+                cmd.extend(["-to", end_time])
+            cmd.extend([
                 "-i", video_path,
                 "-c", "copy",
-                "-avoid_negative_ts", "1",
+                "-avoid_negative_ts", "make_zero",
                 output_path
-            ]
+            ])
             
-            # env=os.environ.copy()
-            result = subprocess.run(cmd, capture_output=True, text=True, env=os.environ.copy())
+            result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             
             if result.returncode == 0:
-                successful += 1
                 print(f"✓ Создан: {output_name}")
-            else:
-                print(f"✗ Ошибка ffmpeg: {output_name}")
+                return True
+            print(f"✗ Ошибка ffmpeg: {output_name}")
         except Exception as e:
             print(f"✗ Ошибка сегмента {idx}: {e}")
+        return False
+    
+    # Вырезка с -c copy упирается в I/O, запускаем несколько ffmpeg параллельно
+    with ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 2)) as executor:
+        successful = sum(executor.map(_cut, range(1, len(segments) + 1), segments, output_names))
     
     print(f"\nРазделение завершено: {successful}/{len(segments)} успешно")
     return successful > 0
 
 def select_mp3_quality(source_abr=None, auto_best=False):
-    qualities = [320, 256, 192, 128, 96, 64, 32, 16]
     if auto_best:
         if source_abr and source_abr > 0:
-            for q_val in qualities:
-                if source_abr >= q_val:
-                    print(f"Авто-выбор MP3: {q_val} kbps")
-                    return str(q_val)
-            return str(qualities[-1])
+            i = bisect.bisect_right(_QS_ASC, source_abr) - 1
+            if i < 0:
+                return str(_QS_ASC[0])
+            print(f"Авто-выбор MP3: {_QS_ASC[i]} kbps")
+            return str(_QS_ASC[i])
         else:
-            return str(qualities[0])
+            return str(_MP3_QUALITIES[0])
 
     print("\nВыберите качество MP3:")
-    for i, q_val in enumerate(qualities):
+    for i, q_val in enumerate(_MP3_QUALITIES):
         print(f"  {i}) {q_val} kbps")
     
     while True:
         try:
             choice = int(input("Ваш выбор: "))
-            if 0 <= choice < len(qualities): return str(qualities[choice])
+            if 0 <= choice < len(_MP3_QUALITIES): return str(_MP3_QUALITIES[choice])
         except ValueError: pass
 
 def run_transcription(mp3_path, language="arabic", model_name="default"):
     """Запускает транскрипцию с защитой от вылетов по памяти."""
+    import gc
     
     # Очистка памяти перед запуском
     gc.collect()
@@ -477,8 +493,6 @@ def run_transcription(mp3_path, language="arabic", model_name="default"):
 
     try:
         print(f"\nЗапуск транскрипции: {os.path.basename(mp3_path)}")
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        transcribe_script_path = os.path.join(script_dir, "transcribe.py")
 
         # Проверка размера файла
         if os.path.exists(mp3_path):
@@ -486,15 +500,14 @@ def run_transcription(mp3_path, language="arabic", model_name="default"):
             if size_mb > 50:
                 print(f"⚠ Файл большой ({int(size_mb)} MB). Возможен вылет на слабых устройствах.")
 
-        if not os.path.exists(transcribe_script_path):
-            print(f"Скрипт транскрипции не найден: {transcribe_script_path}")
+        if not os.path.exists(_TRANSCRIBE_SCRIPT):
+            print(f"Скрипт транскрипции не найден: {_TRANSCRIBE_SCRIPT}")
             return False
 
-        command = [sys.executable, transcribe_script_path, mp3_path, language]
+        command = [sys.executable, _TRANSCRIBE_SCRIPT, mp3_path, language]
         if model_name != "default":
             command.append(model_name)
         
-        # env=os.environ.copy() - критически важно для передачи путей в Termux
         result = subprocess.run(
             command,
             capture_output=True,
@@ -502,7 +515,6 @@ def run_transcription(mp3_path, language="arabic", model_name="default"):
             timeout=3600,
             encoding='utf-8',
             errors='replace',
-            env=os.environ.copy() 
         )
         
         # Очистка памяти после запуска
@@ -567,38 +579,19 @@ def main():
         download_title = "YT_Download"
         is_playlist_download = False
         total_items = 1
+        all_formats = []
+        quick_range = None
+        start_index = 0
+        end_index = None
 
         if url_type == 'playlist':
             is_playlist_download = True
-            print("Анализ плейлиста...")
-            playlist_info = get_media_info(url, is_playlist_hint=True, quiet_mode=False, cookies_path=None)
-            if not playlist_info or 'entries' not in playlist_info: 
-                release_wake_lock()
-                return
-            
-            entries = [e for e in playlist_info['entries'] if e is not None]
-            if not entries: 
-                release_wake_lock()
-                return
-            
-            download_title = sanitize_filename(playlist_info.get('title', 'YT_Playlist'))
-            total_items = len(entries)
-            print(f"Плейлист: {download_title} ({total_items} видео)")
-            
-            # Для плейлиста не получаем форматы первого видео - используем стандартные
-            video_info_for_formats = None
-            all_formats = []
+            r_input = input("Диапазон сразу (Enter = сканировать весь плейлист, пример 1-5): ").strip()
+            if r_input:
+                quick_range = parse_playlist_range(r_input)
+                if not quick_range:
+                    print("Диапазон не распознан (формат A-B или N), сканирую весь плейлист")
 
-        else:
-            print("Анализ видео...")
-            video_info_for_formats = get_media_info(url, quiet_mode=False, cookies_path=None)
-            if not video_info_for_formats: 
-                release_wake_lock()
-                return
-            download_title = sanitize_filename(video_info_for_formats.get('title', 'YT_Video'))
-            print(f"Видео: {download_title}")
-            all_formats = video_info_for_formats.get('formats', [])
-        
         print("\nКачество:")
         quality_choice = get_numeric_choice(
             "", ["Авто", "≤ 1080p", "≤ 720p", "≤ 360p", "Только аудио"], True, 0
@@ -637,9 +630,26 @@ def main():
                 elif action_choice == 2:
                     split_mode = 'chapters'
 
-        start_index = 0
-        end_index = None
-        if is_playlist_download:
+        if is_playlist_download and quick_range:
+            # Диапазон известен: передаём его сразу в скачивание, без сканирования плейлиста
+            start_index, end_index = quick_range[0] - 1, quick_range[1]
+            total_items = end_index
+        elif is_playlist_download:
+            print("Анализ плейлиста...")
+            playlist_info = get_media_info(url, is_playlist_hint=True, quiet_mode=False, cookies_path=None)
+            if not playlist_info or 'entries' not in playlist_info: 
+                release_wake_lock()
+                return
+            
+            total_items = sum(1 for e in playlist_info['entries'] if e is not None)
+            if not total_items: 
+                release_wake_lock()
+                return
+            
+            download_title = sanitize_filename(playlist_info.get('title', 'YT_Playlist'))
+            print(f"Плейлист: {download_title} ({total_items} видео)")
+
+        if is_playlist_download and not quick_range:
             r_input = input(f"Диапазон (Enter=все, пример 1-5): ").strip()
             if r_input:
                 sel = parse_chapter_selection(r_input, total_items)
@@ -647,18 +657,44 @@ def main():
                     start_index = sel[0] - 1
                     end_index = sel[-1]
 
+        # Видео в авто-качестве без обработки и плейлист с заранее заданным
+        # диапазоном не требуют метаданных: один проход extract+download
+        single_pass = bool(quick_range) or (
+            not is_playlist_download and quality_choice == 0 and not split_mode
+        )
+        if not is_playlist_download and not single_pass:
+            print("Анализ видео...")
+            video_info_for_formats = get_media_info(url, quiet_mode=False, cookies_path=None)
+            if not video_info_for_formats: 
+                release_wake_lock()
+                return
+            download_title = sanitize_filename(video_info_for_formats.get('title', 'YT_Video'))
+            print(f"Видео: {download_title}")
+
         save_dir_base = get_android_download_path()
-        save_dir = os.path.join(save_dir_base, download_title)
-        temp_dir = os.path.join(save_dir, 'temp')
-        
-        try: 
-            os.makedirs(save_dir, exist_ok=True)
-            os.makedirs(temp_dir, exist_ok=True)
-        except: 
-            save_dir = save_dir_base
-            temp_dir = save_dir
-        
-        print(f"\nСохранение в: {save_dir}")
+        if single_pass:
+            # Название неизвестно до скачивания, папка создаётся после
+            save_dir = None
+            # Постоянная папка для URL, повторный запуск докачает файлы
+            temp_dir = os.path.join(save_dir_base, '.yt_temp_' + hashlib.sha1(url.encode()).hexdigest()[:12])
+            try:
+                os.makedirs(temp_dir, exist_ok=True)
+            except OSError:
+                save_dir = save_dir_base
+                temp_dir = save_dir
+        else:
+            save_dir = os.path.join(save_dir_base, download_title)
+            temp_dir = os.path.join(save_dir, 'temp')
+            
+            try: 
+                # temp лежит внутри save_dir, один makedirs создаёт обе
+                if not os.path.isdir(temp_dir):
+                    os.makedirs(temp_dir, exist_ok=True)
+            except: 
+                save_dir = save_dir_base
+                temp_dir = save_dir
+            
+            print(f"\nСохранение в: {save_dir}")
 
         output_tmpl = '%(title)s'
         if is_playlist_download:
@@ -675,6 +711,8 @@ def main():
             'postprocessors': postprocessors_opts,
             'quiet': False,
             'nocheckcertificate': True,
+            'cachedir': _CACHE_DIR,
+            'extractor_args': _EXTRACTOR_ARGS,
             'ignoreerrors': True,
         }
 
@@ -691,33 +729,68 @@ def main():
         downloaded_mp3_files = []
         downloaded_video_file = None
 
+        convert_to_mp3 = any(p.get('preferredcodec') == 'mp3' for p in postprocessors_opts)
+        last_progress_time = 0.0
+        last_progress_str = None
+
         def download_hook(d):
+            nonlocal downloaded_video_file, last_progress_time, last_progress_str
             if d['status'] == 'finished':
+                # Путь к MP3 сообщает post_hook после конвертации
+                if convert_to_mp3: return
                 filepath = d.get('filepath') or d.get('filename')
                 if not filepath: return
-                
-                time.sleep(0.5) 
-
-                if postprocessors_opts and any(p.get('preferredcodec') == 'mp3' for p in postprocessors_opts):
-                    base, _ = os.path.splitext(filepath)
-                    mp3_filepath = base + ".mp3"
-                    downloaded_mp3_files.append(mp3_filepath)
-                    print(f"\nГотово: {os.path.basename(mp3_filepath)}")
-                else:
-                    nonlocal downloaded_video_file
-                    downloaded_video_file = filepath
-                    print(f"\nГотово: {os.path.basename(filepath)}")
+                downloaded_video_file = filepath
+                print(f"\nГотово: {os.path.basename(filepath)}")
             
             elif d['status'] == 'downloading':
                 p = d.get('_percent_str', 'N/A')
-                if p != 'N/A': print(f"\rСкачивание: {p}", end='', flush=True)
+                if p == 'N/A' or p == last_progress_str: return
+                # Обновляем прогресс не чаще раза в 200 мс, 100% всегда
+                now = time.monotonic()
+                if now - last_progress_time < 0.2 and '100' not in p: return
+                last_progress_time = now
+                last_progress_str = p
+                print(f"\rСкачивание: {p}", end='', flush=True)
+
+        # yt-dlp вызывает его с итоговым путём после всех постпроцессоров
+        def post_hook(filepath):
+            if not convert_to_mp3 or not filepath: return
+            downloaded_mp3_files.append(filepath)
+            print(f"\nГотово: {os.path.basename(filepath)}")
 
         ydl_opts['progress_hooks'] = [download_hook]
+        ydl_opts['post_hooks'] = [post_hook]
 
         print("\nНачинаю скачивание...")
         
+        import yt_dlp
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+            if single_pass:
+                downloaded_info = ydl.extract_info(url, download=True)
+                if not is_playlist_download:
+                    video_info_for_formats = downloaded_info
+            else:
+                # Используем метаданные из анализа вместо повторного извлечения
+                # Прямой вызов не проходит через обработку ошибок extract_info
+                try:
+                    ydl.process_ie_result(playlist_info if is_playlist_download else video_info_for_formats, download=True)
+                except (yt_dlp.utils.ExtractorError, yt_dlp.utils.DownloadError) as e:
+                    ydl.report_error(str(e))
+        
+        if save_dir is None:
+            if downloaded_info:
+                default_title = 'YT_Playlist' if is_playlist_download else 'YT_Video'
+                download_title = sanitize_filename(downloaded_info.get('title', default_title))
+                save_dir = os.path.join(save_dir_base, download_title)
+                try:
+                    if not os.path.isdir(save_dir):
+                        os.makedirs(save_dir, exist_ok=True)
+                except OSError:
+                    save_dir = save_dir_base
+            else:
+                save_dir = save_dir_base
+            print(f"\nСохранение в: {save_dir}")
         
         # Ищем финальный файл в temp (после merge)
         if not is_audio_only and not postprocessors_opts:
@@ -740,21 +813,18 @@ def main():
                 start_time = cut_segment['start']
                 end_time = cut_segment.get('end')
                 
-                if not end_time:
-                    end_time = get_video_duration(downloaded_video_file)
-                
                 video_name = os.path.splitext(os.path.basename(downloaded_video_file))[0]
                 output_name = f'{video_name}_cut.mp4'
                 output_path = os.path.join(save_dir, output_name)  # В корень папки
                 
-                print(f"Вырезаю: {start_time} - {end_time}")
+                print(f"Вырезаю: {start_time} - {end_time or 'до конца'}")
                 
-                cmd = ['ffmpeg', '-y', '-ss', start_time]
+                cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-ss', start_time]
                 if end_time:
                     cmd.extend(['-to', end_time])
-                cmd.extend(['-i', downloaded_video_file, '-c', 'copy', '-avoid_negative_ts', '1', output_path])
+                cmd.extend(['-i', downloaded_video_file, '-c', 'copy', '-avoid_negative_ts', 'make_zero', output_path])
                 
-                result = subprocess.run(cmd, capture_output=True, text=True, env=os.environ.copy())
+                result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
                 
                 if result.returncode == 0:
                     print(f"✓ Создан: {output_name}")
@@ -791,7 +861,12 @@ def main():
                             t_str = str(datetime.timedelta(seconds=int(c['start_time'])))
                             segments.append({'start': t_str, 'end': None, 'name': c['title']})
                     else:
-                        segments = parse_chapters_from_description(video_info_for_formats.get('description', ''))
+                        description = (video_info_for_formats.get('description') or '')[:_DESCRIPTION_SCAN_LIMIT]
+                        if description:
+                            segments = [
+                                {'start': start, 'end': None, 'name': name}
+                                for _, start, name in parse_chapters_from_description(description)
+                            ]
                 
                 if not segments:
                     print("Главы не найдены.")
@@ -806,11 +881,8 @@ def main():
                             if inds: segments = [segments[i-1] for i in inds]
                     
                     # Расчет конца сегментов
-                    dur_str = get_video_duration(downloaded_video_file)
-                    for i, s in enumerate(segments):
-                        if not s['end']:
-                            if i + 1 < len(segments): s['end'] = segments[i+1]['start']
-                            else: s['end'] = dur_str
+                    for i, s in enumerate(segments[:-1]):
+                        if not s['end']: s['end'] = segments[i+1]['start']
                     
                     # Сохраняем главы в корень папки
                     split_video_by_segments(downloaded_video_file, segments, save_dir)
@@ -848,6 +920,7 @@ def main():
         release_wake_lock()
     except Exception as e:
         print(f"\nКритическая ошибка: {e}")
+        import traceback
         traceback.print_exc()
         release_wake_lock()
 